@@ -2,17 +2,61 @@ import streamlit as st
 import os
 import tempfile
 from pathlib import Path
-import zipfile
-from docx import Document
-from docx.shared import Inches
-import PyPDF2
-import pandas as pd
-from pptx import Presentation
 import io
-from langchain_openai import ChatOpenAI
-from langchain_anthropic import ChatAnthropic
-from langchain.schema import HumanMessage
-import base64
+import asyncio
+import datetime
+import functools
+import hashlib
+import json
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from langchain.schema import HumanMessage, SystemMessage
+
+# File parsers, tokenizer and provider SDKs are imported where they are first
+# needed, so a session only pays for the formats and provider it actually uses.
+
+# Context window (in tokens) of each selectable model
+MODEL_CONTEXT_WINDOWS = {
+    "gpt-4o": 128000,
+    "gpt-4": 8192,
+    "gpt-4-turbo-preview": 128000,
+    "gpt-3.5-turbo": 16385,
+    "claude-3-5-sonnet-20241022": 200000,
+    "claude-3-opus-20240229": 200000,
+    "claude-3-5-haiku-20241022": 200000,
+}
+
+# Share of the context window that extracted project content may fill
+CONTEXT_BUDGET_FRACTION = 0.8
+
+# Default number of simultaneous requests per provider in multiple-student mode
+DEFAULT_CONCURRENCY = {"ChatGPT": 8, "Claude": 4}
+
+# Output tokens reserved for one student's feedback (and the cap on Claude), and
+# each model's output limit. The reply also has to fit in the context window
+# alongside the input; see max_students_per_batch.
+MAX_FEEDBACK_TOKENS = 2048
+MODEL_MAX_OUTPUT_TOKENS = {
+    "gpt-4o": 16384,
+    "gpt-4": 4096,
+    "gpt-4-turbo-preview": 4096,
+    "gpt-3.5-turbo": 4096,
+    "claude-3-5-sonnet-20241022": 8192,
+    "claude-3-opus-20240229": 4096,
+    "claude-3-5-haiku-20241022": 8192,
+}
+
+# How long a cached chat client (which holds the user's API key) stays in memory
+LLM_CLIENT_TTL_SECONDS = 30 * 60
+
+# Maximum LLM requests in flight at once per provider and API key, across all sessions
+MAX_CONCURRENT_LLM_CALLS = 8
+
+# PDFium is not thread-safe, so every call into it is serialized through one lock.
+# Streamlit re-executes this script on every rerun; the lock is kept on the
+# (imported once) threading module so reruns and sessions all share the same one.
+_PDFIUM_LOCK = vars(threading).setdefault("_grading_assistant_pdfium_lock", threading.Lock())
 
 # Page config
 st.set_page_config(
@@ -42,7 +86,7 @@ with st.sidebar:
     api_key = st.text_input(
         api_key_label,
         type="password",
-        help="Your API key will not be stored and is only used for this session"
+        help="Your API key is never saved to disk"
     )
     
     # Model selection based on provider
@@ -71,120 +115,587 @@ with st.sidebar:
         # Get the actual API model name
         model_name = claude_model_options[selected_display_name]
     
+    # Deterministic mode makes responses reproducible, so they can be cached
+    use_cache = st.checkbox(
+        "Cache responses (deterministic)",
+        value=False,
+        help="Uses temperature 0 and reuses feedback for identical content and model for up to an hour"
+    )
+    
+    # Concurrency for grading students as separate requests, within provider rate limits
+    max_concurrency = st.number_input(
+        "Max concurrent requests:",
+        min_value=1,
+        max_value=MAX_CONCURRENT_LLM_CALLS,
+        value=DEFAULT_CONCURRENCY[provider],
+        help="How many students are graded at the same time when using separate requests"
+    )
+    
     st.markdown("---")
     st.markdown("**Supported File Types:**")
     st.markdown("- PDF files")
     st.markdown("- PowerPoint (.pptx)")
     st.markdown("- Word documents (.docx)")
 
-def extract_text_from_pdf(file):
-    """Extract text from PDF file"""
+def max_content_tokens(model_name):
+    """Most project content a single request to the model could ever carry"""
+    return int(MODEL_CONTEXT_WINDOWS.get(model_name, 8192) * CONTEXT_BUDGET_FRACTION)
+
+def context_token_budget(model_name, system_prompt, prompt_overhead="", reserved_output=MAX_FEEDBACK_TOKENS):
+    """Number of tokens of project content that fit comfortably in the model's context.
+    
+    The system prompt and `prompt_overhead` (the user prompt without any project
+    content: headers, student names, file markers) are taken off the budget, and
+    `reserved_output` tokens of the context window are left free for the reply.
+    """
+    context_window = MODEL_CONTEXT_WINDOWS.get(model_name, 8192)
+    context_budget = min(max_content_tokens(model_name), context_window - reserved_output)
+    overhead = count_system_prompt_tokens(system_prompt, model_name) + count_tokens(prompt_overhead, model_name)
+    return max(0, context_budget - overhead)
+
+@functools.lru_cache(maxsize=None)
+def get_encoding(model_name):
+    """Tokenizer for measuring prompt size; models unknown to tiktoken use cl100k_base"""
+    import tiktoken
+    
     try:
+        return tiktoken.encoding_for_model(model_name)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+def count_tokens(text, model_name):
+    """Count the tokens in text for the given model"""
+    return len(get_encoding(model_name).encode(text, disallowed_special=()))
+
+def truncate_to_tokens(text, model_name, token_budget):
+    """Cut text down to at most token_budget tokens; returns the text and its token count"""
+    encoding = get_encoding(model_name)
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= token_budget:
+        return text, len(tokens)
+    return encoding.decode(tokens[:token_budget]), token_budget
+
+@functools.lru_cache(maxsize=None)
+def load_pdfium():
+    """Import pypdfium2 on first use; None means PyPDF2 is used instead"""
+    try:
+        import pypdfium2
+    except ImportError:
+        return None
+    return pypdfium2
+
+@st.cache_data(show_spinner=False)
+def count_system_prompt_tokens(system_prompt, model_name):
+    """Tokens taken by a grading system prompt, counted once per prompt and model"""
+    return count_tokens(system_prompt, model_name)
+
+def extract_text_from_pdf(file):
+    """Yield the text of each PDF page, one page at a time"""
+    pdfium = load_pdfium()
+    if pdfium is None:
+        import PyPDF2
+        
         pdf_reader = PyPDF2.PdfReader(file)
-        text = ""
         for page in pdf_reader.pages:
-            text += page.extract_text() + "\n"
-        return text
+            yield page.extract_text() or ""
+        return
+    
+    with _PDFIUM_LOCK:
+        pdf = pdfium.PdfDocument(file)
+        page_count = len(pdf)
+    try:
+        for index in range(page_count):
+            with _PDFIUM_LOCK:
+                page = pdf[index]
+                textpage = page.get_textpage()
+                text = textpage.get_text_range()
+                textpage.close()
+                page.close()
+            yield text
+    finally:
+        with _PDFIUM_LOCK:
+            pdf.close()
+
+def count_pdf_pages(file):
+    """Count the pages of a PDF file without extracting any text"""
+    pdfium = load_pdfium()
+    if pdfium is None:
+        import PyPDF2
+        
+        return len(PyPDF2.PdfReader(file).pages)
+    
+    with _PDFIUM_LOCK:
+        pdf = pdfium.PdfDocument(file)
+        try:
+            return len(pdf)
+        finally:
+            pdf.close()
+
+def extract_pdf_within_budget(file, model_name, token_budget):
+    """Extract PDF pages until the token budget is used up.
+    
+    Returns the extracted text, its token count and the number of pages that were skipped.
+    """
+    try:
+        parts = []
+        used_tokens = 0
+        for page_text in extract_text_from_pdf(file):
+            page_tokens = count_tokens(page_text, model_name)
+            if used_tokens + page_tokens > token_budget:
+                break
+            parts.append(page_text)
+            used_tokens += page_tokens
+        else:
+            return "\n".join(parts), used_tokens, 0
+        
+        return "\n".join(parts), used_tokens, count_pdf_pages(file) - len(parts)
     except Exception as e:
-        return f"Error reading PDF: {str(e)}"
+        text = f"Error reading PDF: {str(e)}"
+        return text, count_tokens(text, model_name), 0
 
 def extract_text_from_docx(file):
     """Extract text from DOCX file"""
+    from docx import Document
+    
     try:
         doc = Document(file)
-        text = ""
-        for paragraph in doc.paragraphs:
-            text += paragraph.text + "\n"
-        return text
+        return "\n".join(paragraph.text for paragraph in doc.paragraphs)
     except Exception as e:
         return f"Error reading DOCX: {str(e)}"
 
 def extract_text_from_pptx(file):
     """Extract text from PPTX file"""
+    from pptx import Presentation
+    
     try:
         prs = Presentation(file)
-        text = ""
+        parts = []
         for slide in prs.slides:
             for shape in slide.shapes:
-                if hasattr(shape, "text"):
-                    text += shape.text + "\n"
-        return text
+                # Pictures, connectors and other graphics have no text frame
+                if not shape.has_text_frame:
+                    continue
+                parts.extend(paragraph.text for paragraph in shape.text_frame.paragraphs)
+        return "\n".join(parts)
     except Exception as e:
         return f"Error reading PPTX: {str(e)}"
 
-def process_file(uploaded_file):
+@st.cache_data(show_spinner=False, max_entries=128)
+def extract_text(file_digest, file_extension, model_name, _uploaded_file):
+    """Extract text from an uploaded file, cached on the digest of its content.
+    
+    The upload is written to a temporary file so the parsers read from disk
+    instead of holding their own copy of the bytes; the file is removed afterwards.
+    Text is capped at the most a request to the model could carry; trimming to a
+    particular prompt's budget happens in fit_to_budget, so the cache key doesn't
+    change with student or file names. Returns the text, its token count and the
+    number of PDF pages skipped.
+    """
+    token_budget = max_content_tokens(model_name)
+    if file_extension not in ('.pdf', '.docx', '.pptx'):
+        return "Unsupported file format", count_tokens("Unsupported file format", model_name), 0
+    
+    with tempfile.NamedTemporaryFile(suffix=file_extension, delete=False) as temp_file:
+        with _uploaded_file.getbuffer() as buffer:
+            temp_file.write(buffer)
+    
+    try:
+        if file_extension == '.pdf':
+            return extract_pdf_within_budget(temp_file.name, model_name, token_budget)
+        elif file_extension == '.docx':
+            return (*truncate_to_tokens(extract_text_from_docx(temp_file.name), model_name, token_budget), 0)
+        else:
+            return (*truncate_to_tokens(extract_text_from_pptx(temp_file.name), model_name, token_budget), 0)
+    finally:
+        os.unlink(temp_file.name)
+
+def process_file(uploaded_file, model_name):
     """Process uploaded file and extract content"""
     file_extension = Path(uploaded_file.name).suffix.lower()
+    with uploaded_file.getbuffer() as buffer:
+        file_digest = hashlib.blake2b(buffer, digest_size=16).hexdigest()
+    return extract_text(file_digest, file_extension, model_name, uploaded_file)
+
+def share_token_budget(token_counts, token_budget):
+    """Split the token budget between files.
+    
+    Files needing less than an even share keep only what they need, and the
+    remainder is shared among the larger files.
+    """
+    allowances = [0] * len(token_counts)
+    remaining = token_budget
+    by_size = sorted(range(len(token_counts)), key=lambda index: token_counts[index])
+    for position, index in enumerate(by_size):
+        share = remaining // (len(by_size) - position)
+        allowances[index] = min(token_counts[index], share)
+        remaining -= allowances[index]
+    return allowances
+
+def extract_files(uploaded_files, model_name):
+    """Extract every uploaded file in parallel; returns (text, token count, skipped pages) per file"""
+    for file in uploaded_files:
+        st.write(f"Processing: {file.name}")
     
-    if file_extension == '.pdf':
-        return extract_text_from_pdf(uploaded_file)
-    elif file_extension == '.docx':
-        return extract_text_from_docx(uploaded_file)
-    elif file_extension == '.pptx':
-        return extract_text_from_pptx(uploaded_file)
+    extract = functools.partial(process_file, model_name=model_name)
+    with ThreadPoolExecutor(max_workers=min(8, len(uploaded_files))) as executor:
+        return list(executor.map(extract, uploaded_files))
+
+def fit_to_budget(uploaded_files, results, model_name, token_budget, shared=True):
+    """Trim extracted files to the token budget of the request they go into.
+    
+    With `shared`, all files go into one request and split token_budget between
+    them; otherwise each file is sent on its own and may use the whole budget.
+    Returns one text per file and reports shortened files in the UI.
+    """
+    if shared:
+        allowances = share_token_budget([token_count for _, token_count, _ in results], token_budget)
     else:
-        return "Unsupported file format"
+        allowances = [token_budget] * len(results)
+    
+    contents = []
+    for file, (content, token_count, skipped_pages), allowance in zip(uploaded_files, results, allowances):
+        if token_count > allowance:
+            content, _ = truncate_to_tokens(content, model_name, allowance)
+            st.warning(f"⚠️ {file.name}: content cut to {allowance} tokens to fit the model's context window")
+        elif skipped_pages:
+            st.warning(f"⚠️ {file.name}: {skipped_pages} page(s) skipped to fit the model's context window")
+        contents.append(content)
+    
+    return contents
 
-def generate_feedback(content, student_name, file_name, api_key, model_name, provider):
-    """Generate feedback using OpenAI or Anthropic API via LangChain"""
-    try:
-        # Initialize the appropriate model based on provider
-        if provider == "ChatGPT":
-            llm = ChatOpenAI(
-                api_key=api_key,
-                model=model_name,
-                temperature=0.7
-            )
-        else:  # Claude
-            llm = ChatAnthropic(
-                anthropic_api_key=api_key,
-                model=model_name,
-                temperature=0.7
-            )
+def extract_all(uploaded_files, model_name, token_budget, shared=True):
+    """Extract every uploaded file in parallel and trim it to the token budget"""
+    results = extract_files(uploaded_files, model_name)
+    return fit_to_budget(uploaded_files, results, model_name, token_budget, shared)
+
+# Feedback structure shared by the single-student and batched system prompts
+FEEDBACK_STRUCTURE = """
+1. **Overall Assessment** (Grade: A/B/C/D/F): brief summary of project quality
+2. **Strengths**: what the student did well, with specific examples from the work
+3. **Areas for Improvement**: specific weaknesses and constructive suggestions
+4. **Technical Quality**: content organization, structure and clarity of presentation
+5. **Recommendations**: concrete next steps, resources or techniques to explore
+
+Be constructive, specific and encouraging while keeping academic standards.
+"""
+
+# System prompts, sent separately from the student-specific user prompt. They are
+# well under the 1024-token minimum for provider-side prompt caching, so they are
+# simply kept short to save input tokens on every request.
+GRADING_INSTRUCTIONS = f"""You are an experienced academic instructor grading student projects.
+Give detailed feedback on the submitted project using this structure:
+{FEEDBACK_STRUCTURE}"""
+
+BATCH_GRADING_INSTRUCTIONS = f"""You are an experienced academic instructor grading student projects.
+Each submission starts with a "### STUDENT k" header. Grade each one independently; never compare students.
+Give detailed feedback for each student using this structure:
+{FEEDBACK_STRUCTURE}
+Return ONLY a JSON array, one object per student:
+[{{"student_id": 1, "feedback": "<markdown feedback>"}}, ...]
+where student_id is k from the "### STUDENT k" header.
+"""
+
+def hash_api_key(api_key):
+    """Hash the API key so cache entries are scoped per user without storing the key"""
+    return hashlib.sha256(api_key.encode()).hexdigest()
+
+@st.cache_resource(show_spinner=False, ttl=LLM_CLIENT_TTL_SECONDS, max_entries=32)
+def get_llm(provider, model_name, key_hash, temperature, max_tokens, _api_key):
+    """Initialize the appropriate chat model based on provider.
+    
+    The client is kept across reruns and keyed on the API key hash, so its
+    connection pool is reused without sharing clients between different keys.
+    Entries expire after LLM_CLIENT_TTL_SECONDS, so keys are not held in memory indefinitely.
+    """
+    if provider == "ChatGPT":
+        from langchain_openai import ChatOpenAI
+        
+        return ChatOpenAI(
+            api_key=_api_key,
+            model=model_name,
+            temperature=temperature,
+            streaming=True
+        )
+    else:  # Claude
+        from langchain_anthropic import ChatAnthropic
         
-        # Create the grading prompt
-        prompt = f"""
-You are an experienced academic instructor grading student projects. 
+        return ChatAnthropic(
+            anthropic_api_key=_api_key,
+            model=model_name,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            streaming=True
+        )
+
+class ConcurrencyLimiter:
+    """Caps the number of LLM requests in flight; the rest wait for a free slot.
+    
+    Waiters are not served in arrival order, and a new request may take a slot
+    that frees up before an older waiter wakes.
+    """
+    
+    def __init__(self, max_concurrency):
+        self._semaphore = threading.Semaphore(max_concurrency)
+        self._lock = threading.Lock()
+        self._waiting = 0
+    
+    def acquire(self, on_wait=None):
+        """Take a slot, calling on_wait(waiting_count) first if none is free.
+        
+        waiting_count is the number of requests waiting, including this one.
+        """
+        if self._semaphore.acquire(blocking=False):
+            return
+        with self._lock:
+            self._waiting += 1
+            position = self._waiting
+        try:
+            if on_wait is not None:
+                on_wait(position)
+            self._semaphore.acquire()
+        finally:
+            with self._lock:
+                self._waiting -= 1
+    
+    async def acquire_async(self):
+        """Take a slot from a worker thread without blocking the event loop.
+        
+        If the awaiting task is cancelled, the slot the thread still ends up
+        taking is released straight away instead of being leaked.
+        """
+        future = asyncio.get_running_loop().run_in_executor(None, self.acquire)
+        try:
+            await asyncio.shield(future)
+        except asyncio.CancelledError:
+            future.add_done_callback(
+                lambda done: self.release() if not done.cancelled() and done.exception() is None else None
+            )
+            raise
+    
+    def release(self):
+        self._semaphore.release()
+    
+    @contextmanager
+    def slot(self, on_wait=None):
+        self.acquire(on_wait)
+        try:
+            yield
+        finally:
+            self.release()
+
+@st.cache_resource(ttl=3600, max_entries=64)
+def get_llm_limiter(provider, key_hash):
+    """Limiter shared by every session using the same provider and API key.
+    
+    Provider rate limits apply per key, so one user's requests never queue
+    behind another user's key.
+    """
+    return ConcurrencyLimiter(MAX_CONCURRENT_LLM_CALLS)
 
-Student Name: {student_name}
+def show_queue_position(placeholder):
+    """Return an on_wait callback that reports how many requests are waiting in placeholder"""
+    def on_wait(waiting_count):
+        placeholder.info(f"⏳ Waiting for a free request slot ({waiting_count} request(s) waiting)...")
+    return on_wait
+
+def create_llm(provider, model_name, api_key, temperature=0.7, max_tokens=MAX_FEEDBACK_TOKENS):
+    """Get the cached chat model for this provider, model and API key.
+    
+    max_tokens caps the response length on Claude only.
+    """
+    return get_llm(provider, model_name, hash_api_key(api_key), temperature, max_tokens, api_key)
+
+def build_messages(system_prompt, prompt):
+    """Pair the shared system prompt with the student-specific prompt"""
+    return [SystemMessage(content=system_prompt), HumanMessage(content=prompt)]
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def _invoke_llm(system_prompt, prompt, model_name, provider, key_hash, _api_key, max_tokens=MAX_FEEDBACK_TOKENS):
+    """Deterministic (temperature 0) LLM call, cached on prompts, model, provider and key hash"""
+    llm = create_llm(provider, model_name, _api_key, temperature=0, max_tokens=max_tokens)
+    with get_llm_limiter(provider, key_hash).slot():
+        response = llm.invoke(build_messages(system_prompt, prompt))
+    return response.content
+
+def build_prompt(content, student_name, file_name):
+    """Create the student-specific part of the grading prompt"""
+    return f"""Student Name: {student_name}
 Project File: {file_name}
 
 Project Content:
 {content}
-
-Please provide detailed feedback on this student project following this structure:
-
-1. **Overall Assessment** (Grade: A/B/C/D/F)
-   - Brief summary of the project quality
-   
-2. **Strengths**
-   - What the student did well
-   - Specific examples from their work
-   
-3. **Areas for Improvement**
-   - Specific areas that need work
-   - Constructive suggestions
-   
-4. **Technical Quality**
-   - Content organization and structure
-   - Clarity of presentation
-   
-5. **Recommendations**
-   - Specific next steps for improvement
-   - Resources or techniques to explore
-
-Please be constructive, specific, and encouraging while maintaining academic standards.
 """
+
+async def generate_feedback(content, student_name, file_name, api_key, model_name, provider,
+                            placeholder=None, use_cache=False):
+    """Stream feedback using OpenAI or Anthropic API via LangChain.
+    
+    Tokens are rendered into `placeholder` (an `st.empty()`) as they arrive;
+    the full feedback text is returned once the stream finishes. With
+    `use_cache`, a deterministic response is fetched (or reused) in one piece.
+    """
+    try:
+        prompt = build_prompt(content, student_name, file_name)
         
-        # Generate response using the updated method
-        response = llm.invoke([HumanMessage(content=prompt)])
-        return response.content
+        if use_cache:
+            feedback = _invoke_llm(
+                GRADING_INSTRUCTIONS, prompt, model_name, provider, hash_api_key(api_key), api_key
+            )
+            if placeholder is not None:
+                placeholder.markdown(feedback)
+            return feedback
+        
+        # Stream the response token by token
+        llm = create_llm(provider, model_name, api_key)
+        on_wait = show_queue_position(placeholder) if placeholder is not None else None
+        feedback = ""
+        with get_llm_limiter(provider, hash_api_key(api_key)).slot(on_wait):
+            async for chunk in llm.astream(build_messages(GRADING_INSTRUCTIONS, prompt)):
+                if isinstance(chunk.content, str):
+                    feedback += chunk.content
+                if placeholder is not None:
+                    placeholder.markdown(feedback)
+        return feedback
         
     except Exception as e:
         return f"Error generating feedback: {str(e)}"
 
-def create_word_document(feedback, student_name, file_name):
-    """Create a Word document with the feedback"""
+def parse_batch_feedback(reply, count):
+    """Split a batched LLM reply into per-student feedback, in submission order"""
+    # Expected format: JSON array of {"student_id": k, "feedback": "..."}, possibly
+    # wrapped in a code fence or surrounded by stray text
+    start, end = reply.find("["), reply.rfind("]")
+    try:
+        # strict=False accepts raw newlines inside strings, common in multi-line markdown
+        entries = json.loads(reply[start:end + 1], strict=False)
+        if not isinstance(entries, list):
+            raise TypeError("batched response is not a JSON array")
+        by_id = {int(entry["student_id"]): str(entry["feedback"]) for entry in entries}
+    except (ValueError, TypeError, KeyError):
+        # Keep the paid-for reply rather than discarding it
+        note = ("⚠️ The batched response could not be split per student. "
+                "Full response for all students:\n\n")
+        return [note + reply] * count
+    
+    return [by_id.get(k, "Error generating feedback: missing from batched response")
+            for k in range(1, count + 1)]
+
+def build_batch_prompt(items):
+    """Concatenate every submission under an explicit "### STUDENT k" delimiter"""
+    submissions = "".join(
+        f"""
+### STUDENT {k}
+Student Name: {item['student_name']}
+Project File: {item['file_name']}
+
+Project Content:
+{item['content']}
+"""
+        for k, item in enumerate(items, start=1)
+    )
+    return f"""There are {len(items)} submissions:
+{submissions}"""
+
+def max_students_per_batch(model_name):
+    """How many students' feedback fits in one reply.
+    
+    The reply is bounded by the model's output limit and by the part of the
+    context window that a full-size input leaves free.
+    """
+    context_window = MODEL_CONTEXT_WINDOWS.get(model_name, 8192)
+    output_space = min(MODEL_MAX_OUTPUT_TOKENS.get(model_name, 4096),
+                       context_window - max_content_tokens(model_name))
+    return max(1, output_space // MAX_FEEDBACK_TOKENS)
+
+def generate_feedback_batch(items, api_key, model_name, provider, use_cache=False):
+    """Generate feedback for several students in a single LLM request.
+    
+    Each item is a dict with 'student_name', 'file_name' and 'content' keys.
+    Rosters larger than max_students_per_batch are split into several requests,
+    each built with room left in the context for every student's feedback.
+    Returns one feedback string per item, in the same order.
+    """
+    batch_size = max_students_per_batch(model_name)
+    if len(items) > batch_size:
+        request_count = -(-len(items) // batch_size)
+        st.info(f"Grading {len(items)} students in {request_count} requests of up to {batch_size} students each.")
+        feedbacks = []
+        for start in range(0, len(items), batch_size):
+            feedbacks.extend(generate_feedback_batch(
+                items[start:start + batch_size], api_key, model_name, provider, use_cache
+            ))
+        return feedbacks
+    
+    if len(items) == 1:
+        item = items[0]
+        return [asyncio.run(generate_feedback(item['content'], item['student_name'], item['file_name'],
+                                              api_key, model_name, provider, use_cache=use_cache))]
+    
+    try:
+        prompt = build_batch_prompt(items)
+        
+        # Leave room for every student's feedback; batch size keeps this within the output limit
+        max_tokens = MAX_FEEDBACK_TOKENS * len(items)
+        
+        if use_cache:
+            reply = _invoke_llm(
+                BATCH_GRADING_INSTRUCTIONS, prompt, model_name, provider, hash_api_key(api_key), api_key,
+                max_tokens
+            )
+        else:
+            llm = create_llm(provider, model_name, api_key, max_tokens=max_tokens)
+            queue_notice = st.empty()
+            with get_llm_limiter(provider, hash_api_key(api_key)).slot(show_queue_position(queue_notice)):
+                queue_notice.empty()
+                reply = llm.invoke(build_messages(BATCH_GRADING_INSTRUCTIONS, prompt)).content
+        return parse_batch_feedback(reply, len(items))
+        
+    except Exception as e:
+        return [f"Error generating feedback: {str(e)}"] * len(items)
+
+async def _grade_one(item, semaphore, api_key, model_name, provider, use_cache):
+    """Grade one student in its own request once a concurrency slot is free"""
+    prompt = build_prompt(item['content'], item['student_name'], item['file_name'])
+    
+    async with semaphore:
+        try:
+            if use_cache:
+                return await asyncio.to_thread(
+                    _invoke_llm, GRADING_INSTRUCTIONS, prompt, model_name, provider, hash_api_key(api_key), api_key
+                )
+            llm = create_llm(provider, model_name, api_key)
+            # Wait for a shared slot off the event loop so other students keep running
+            limiter = get_llm_limiter(provider, hash_api_key(api_key))
+            await limiter.acquire_async()
+            try:
+                response = await llm.ainvoke(build_messages(GRADING_INSTRUCTIONS, prompt))
+            finally:
+                limiter.release()
+            return response.content
+        except Exception as e:
+            return f"Error generating feedback: {str(e)}"
+
+def generate_feedback_concurrent(items, api_key, model_name, provider, max_concurrency, use_cache=False):
+    """Grade each student in a separate request, running up to max_concurrency at once.
+    
+    Returns one feedback string per item, in the same order.
+    """
+    async def grade_all():
+        semaphore = asyncio.Semaphore(max_concurrency)
+        return await asyncio.gather(
+            *[_grade_one(item, semaphore, api_key, model_name, provider, use_cache) for item in items]
+        )
+    
+    return asyncio.run(grade_all())
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def create_word_document(feedback, student_name, file_name, timestamp):
+    """Create a Word document with the feedback and return its bytes.
+    
+    Cached, so each unique piece of feedback is rendered to .docx only once.
+    """
+    from docx import Document
+    
     doc = Document()
     
     # Add title
@@ -194,7 +705,7 @@ def create_word_document(feedback, student_name, file_name):
     doc.add_heading('Project Details', level=1)
     doc.add_paragraph(f'Student: {student_name}')
     doc.add_paragraph(f'File: {file_name}')
-    doc.add_paragraph(f'Generated: {st.session_state.get("timestamp", "N/A")}')
+    doc.add_paragraph(f'Generated: {timestamp}')
     
     # Add feedback content
     doc.add_heading('AI-Generated Feedback', level=1)
@@ -204,12 +715,125 @@ def create_word_document(feedback, student_name, file_name):
     doc.add_heading('Teacher Notes', level=1)
     doc.add_paragraph('Please review and edit the above feedback as needed before sharing with the student.')
     
-    # Save to bytes
-    doc_bytes = io.BytesIO()
-    doc.save(doc_bytes)
-    doc_bytes.seek(0)
+    # Save to bytes; small documents stay in memory, large ones spill to disk
+    with tempfile.SpooledTemporaryFile(max_size=4 * 1024 * 1024) as doc_file:
+        doc.save(doc_file)
+        doc_file.seek(0)
+        return doc_file.read()
+
+def batch_section():
+    """Upload one file per student and grade them all in one batched or several concurrent requests"""
+    st.header("📁 Upload Student Projects")
+    
+    uploaded_files = st.file_uploader(
+        "Choose project files (one per student)",
+        type=['pdf', 'docx', 'pptx'],
+        accept_multiple_files=True,
+        help="The student name is taken from each file name"
+    )
+    
+    if uploaded_files:
+        st.success(f"📁 {len(uploaded_files)} student file(s) uploaded")
+        
+        # Display uploaded files
+        st.subheader("Uploaded Files:")
+        for file in uploaded_files:
+            st.write(f"• {Path(file.name).stem}: {file.name} ({file.size} bytes)")
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            batched = st.button("🤖 Generate Feedback for All", type="primary",
+                                help="Grade every student in a single request")
+        with col2:
+            separate = st.button("⚡ Generate Separately",
+                                 help="Grade each student in its own request, several at a time")
+        
+        if batched or separate:
+            with st.spinner("Processing files and generating feedback..."):
+                
+                items = [
+                    {'student_name': Path(file.name).stem, 'file_name': file.name, 'content': ""}
+                    for file in uploaded_files
+                ]
+                
+                # Extract content from all files in parallel
+                results = extract_files(uploaded_files, model_name)
+                
+                if batched:
+                    # Each batched request (see generate_feedback_batch) shares one
+                    # context window between the students it carries
+                    batch_size = max_students_per_batch(model_name)
+                    contents = []
+                    for start in range(0, len(items), batch_size):
+                        group = slice(start, start + batch_size)
+                        token_budget = context_token_budget(
+                            model_name, BATCH_GRADING_INSTRUCTIONS, build_batch_prompt(items[group]),
+                            MAX_FEEDBACK_TOKENS * len(items[group])
+                        )
+                        contents.extend(fit_to_budget(
+                            uploaded_files[group], results[group], model_name, token_budget
+                        ))
+                else:
+                    # Separate requests each get their own context window
+                    longest_header = max(
+                        (build_prompt("", item['student_name'], item['file_name']) for item in items),
+                        key=len
+                    )
+                    token_budget = context_token_budget(model_name, GRADING_INSTRUCTIONS, longest_header)
+                    contents = fit_to_budget(uploaded_files, results, model_name, token_budget, shared=False)
+                
+                for item, content in zip(items, contents):
+                    item['content'] = content
+                
+                if batched:
+                    # Generate feedback for every student in one request
+                    feedbacks = generate_feedback_batch(items, api_key, model_name, provider, use_cache)
+                else:
+                    # Generate feedback with one request per student, run concurrently
+                    feedbacks = generate_feedback_concurrent(
+                        items, api_key, model_name, provider, max_concurrency, use_cache
+                    )
+                
+                timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                
+                # Store in session state
+                st.session_state['batch_feedback'] = [
+                    {
+                        'student_name': item['student_name'],
+                        'file_name': item['file_name'],
+                        'feedback': feedback,
+                        'timestamp': timestamp
+                    }
+                    for item, feedback in zip(items, feedbacks)
+                ]
+                
+                st.success("✅ Feedback generated successfully!")
     
-    return doc_bytes
+    # Display feedback and download options
+    if 'batch_feedback' in st.session_state:
+        st.header("📝 Generated Feedback")
+        
+        for index, entry in enumerate(st.session_state['batch_feedback']):
+            with st.expander(f"{entry['student_name']} ({entry['file_name']})", expanded=False):
+                st.markdown(entry['feedback'])
+                
+                st.download_button(
+                    label="📄 Download Feedback (Word Document)",
+                    data=create_word_document(
+                        entry['feedback'],
+                        entry['student_name'],
+                        entry['file_name'],
+                        entry['timestamp']
+                    ),
+                    file_name=f"{entry['student_name']}_feedback.docx",
+                    mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+                    key=f"download_batch_{index}"
+                )
+        
+        # Clear button
+        if st.button("🗑️ Clear and Start New"):
+            del st.session_state['batch_feedback']
+            st.rerun()
 
 # Main application
 def main():
@@ -218,6 +842,17 @@ def main():
         st.warning(f"⚠️ Please enter your {provider_name} API key in the sidebar to continue.")
         st.stop()
     
+    grading_mode = st.radio(
+        "Grading Mode:",
+        ["Single student", "Multiple students"],
+        horizontal=True,
+        help="In multiple-student mode each uploaded file is graded as a separate student"
+    )
+    
+    if grading_mode == "Multiple students":
+        batch_section()
+        return
+    
     # File upload section
     st.header("📁 Upload Student Project")
     
@@ -249,29 +884,39 @@ def main():
         if st.button("🤖 Generate Feedback", type="primary"):
             with st.spinner("Processing files and generating feedback..."):
                 
-                # Extract content from all files
-                all_content = ""
-                for file in uploaded_files:
-                    st.write(f"Processing: {file.name}")
-                    content = process_file(file)
-                    all_content += f"\n\n--- Content from {file.name} ---\n{content}"
+                # Extract content from all files in parallel
+                file_markers = "".join(f"--- {file.name} ---\n\n" for file in uploaded_files)
+                token_budget = context_token_budget(
+                    model_name,
+                    GRADING_INSTRUCTIONS,
+                    build_prompt(file_markers, student_name, ", ".join(f.name for f in uploaded_files))
+                )
+                results = extract_all(uploaded_files, model_name, token_budget)
                 
-                # Generate feedback
-                feedback = generate_feedback(
+                buffer = io.StringIO()
+                for file, content in zip(uploaded_files, results):
+                    buffer.write(f"--- {file.name} ---\n{content}\n")
+                all_content = buffer.getvalue()
+                
+                # Generate feedback, streaming tokens as they arrive
+                placeholder = st.empty()
+                feedback = asyncio.run(generate_feedback(
                     all_content, 
                     student_name, 
                     ", ".join([f.name for f in uploaded_files]),
                     api_key,
                     model_name,
-                    provider
-                )
+                    provider,
+                    placeholder,
+                    use_cache
+                ))
+                placeholder.empty()
                 
                 # Store in session state
                 st.session_state['feedback'] = feedback
                 st.session_state['student_name'] = student_name
                 st.session_state['file_names'] = [f.name for f in uploaded_files]
-                st.session_state['timestamp'] = st.session_state.get('timestamp', 
-                    f"{st.session_state.get('timestamp', pd.Timestamp.now().strftime('%Y-%m-%d %H:%M:%S'))}")
+                st.session_state.setdefault('timestamp', datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
                 
                 st.success("✅ Feedback generated successfully!")
     
@@ -286,17 +931,18 @@ def main():
         # Create and offer download
         st.subheader("💾 Download Feedback")
         
-        # Create Word document
+        # Create Word document (cached, so reruns reuse the same bytes)
         doc_bytes = create_word_document(
             st.session_state['feedback'],
             st.session_state['student_name'],
-            ", ".join(st.session_state['file_names'])
+            ", ".join(st.session_state['file_names']),
+            st.session_state['timestamp']
         )
         
         # Download button
         st.download_button(
             label="📄 Download Feedback (Word Document)",
-            data=doc_bytes.getvalue(),
+            data=doc_bytes,
             file_name=f"{st.session_state['student_name']}_feedback.docx",
             mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
         )